@@ -1,10 +1,131 @@
 """A minimal uWeb3 project scaffold."""
 import os
+import sys
+import warnings
 # Third-party modules
 import uweb3
 
 # Application
+from . import admission
 from . import pages
+from . import request
+
+class uWeb(uweb3.uWeb):
+  """uWeb3 application that applies admission control before a request reaches
+  its PageMaker, and hands the PageMaker a lazily parsed request.
+
+  Requests for routes that are at their configured concurrency limit are
+  answered with a plain 503, without a PageMaker or template parser. These are
+  still written to the access log.
+
+  The lazy request handling relies on copies of uweb3 code, on a uweb3 release
+  other than request.UWEB3_VERSION the stock uweb3 request handling is used."""
+  REQUEST_CLASS = request.Request
+
+  def __init__(self, page_class, routes, executing_path=None, config='config'):
+    """Sets up the application, its admission control and request handling."""
+    super(uWeb, self).__init__(page_class, routes, executing_path, config)
+    self.registry.admission = admission.AdmissionControl(
+        self.config.options.get('admission', {}))
+    self.stock_handling = uweb3.__version__ != request.UWEB3_VERSION
+    if self.stock_handling:
+      warnings.warn('uweb3 %s is installed, the lazy request handling was copied '
+                    'from uweb3 %s. Falling back to the stock uweb3 request '
+                    'handling.' % (uweb3.__version__, request.UWEB3_VERSION))
+      self.REQUEST_CLASS = uweb3.request.Request
+
+  def __call__(self, env, start_response):
+    """WSGI request handler, holds a slot for limited routes while the request
+    is being handled.
+
+    The request is routed once here, and the route is handed to _Handle."""
+    try:
+      route = self.router(env['PATH_INFO'], env['REQUEST_METHOD'],
+                          env.get('HTTP_HOST', ''))
+    except uweb3.NoRouteError:
+      route = None
+    limit = self.registry.admission.Limit(route[0] if route else None)
+    if limit is None:
+      yield from self._Handle(env, start_response, route)
+      return
+    if not limit.Acquire(admission.QueueTime(env)):
+      response = self.registry.admission.Shed()
+      self._logging(self.REQUEST_CLASS(env, self.registry), response)
+      start_response(response.status, response.headerlist)
+      yield response.text.encode(response.charset)
+      return
+    try:
+      yield from self._Handle(env, start_response, route)
+    finally:
+      limit.Release()
+
+  def _Handle(self, env, start_response, route):
+    """Handles the request like uweb3.uWeb.__call__ from uweb3 3.0.4 does, using
+    `REQUEST_CLASS` to wrap the WSGI environment. Keep in sync with
+    request.UWEB3_VERSION. `route` is the router's result, or None if no route
+    matched.
+
+    With stock request handling the request is handed to uweb3.uWeb.__call__,
+    which routes it again."""
+    if self.stock_handling:
+      yield from super(uWeb, self).__call__(env, start_response)
+      return
+    req = self.REQUEST_CLASS(env, self.registry)
+    req.env['REAL_REMOTE_ADDR'] = uweb3.request.return_real_remote_addr(req.env)
+    response = None
+    method = '_NotFound'
+    args = None
+    if route:
+      method, args, hostargs, page_maker = route
+    else:
+      page_maker = self.inital_pagemaker
+    try:
+      pagemaker_instance = page_maker(req,
+                            config=self.config,
+                            executing_path=self.executing_path)
+      if hasattr(pagemaker_instance, '_PreRequest'):
+        pagemaker_instance = pagemaker_instance._PreRequest()
+      response = self.get_response(pagemaker_instance, method, args)
+    except Exception:
+      if hasattr(pagemaker_instance, '_ConnectionRollback'):
+        try:
+          pagemaker_instance._ConnectionRollback()
+        except:
+          pass
+      pagemaker_instance = uweb3.PageMaker(req,
+                            config=self.config,
+                            executing_path=self.executing_path)
+      response = pagemaker_instance.InternalServerError(*sys.exc_info())
+
+    static = method == 'Static'
+    if not static:
+      if not isinstance(response, uweb3.Response):
+        req.response.text = response
+        response = req.response
+
+      if not isinstance(response.text, uweb3.Basesafestring):
+        encoder = self.encoders.get(response.clean_content_type(), self.encoders['default'])
+        response.text = encoder(response.text)
+
+      if hasattr(pagemaker_instance, '_PostRequest'):
+        pagemaker_instance._PostRequest()
+
+    if hasattr(pagemaker_instance, '_CSPheaders'):
+      pagemaker_instance._CSPheaders()
+
+    if not static and hasattr(pagemaker_instance, 'PostRequest'):
+      response = pagemaker_instance.PostRequest(response)
+
+    if not response.text:
+      response.text = ''
+
+    self._logging(req, response)
+    start_response(response.status, response.headerlist)
+    try:
+      yield response.text.encode(response.charset)
+    except AttributeError:
+      yield response.text
+
 
 def main():
   """Creates a uWeb3 application.
@@ -16,7 +137,7 @@ def main():
     name of a presenter method which should handle it.
   - The execution path, internally used to find templates etc.
   """
-  return uweb3.uWeb(pages.PageMaker,
+  return uWeb(pages.PageMaker,
       [('/', 'Index'),
        ('/post', 'Post'),
        ('/method', 'Index', 'GET'),
@@ -39,6 +160,7 @@ def main():
        ('/mysql/read/(\d+)/?(.*)?', 'MysqlRead'),
        ('/mysql/write', 'MysqlWrite', 'POST'),
        ('/jsonapi/read/(.*)', 'JsonApiRead'),
+       ('/admission', 'AdmissionStats'),
        ('/redirect', 'Redirect'),
        ('/static/(.*)', 'Static'),
        ('/error', 'ThrowError'),
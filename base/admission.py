@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+"""Admission control for the uweb3 test server.
+
+Expensive routes can be given a concurrency limit and a queue-time budget in
+the [admission] section of config.ini, keyed by the lowercased handler name:
+
+  [admission]
+  retry_after = 1
+  mysqlread = 8, 0.5
+
+This allows at most 8 MysqlRead requests to run at the same time, others wait
+up to 0.5 seconds for a slot before being turned away with a 503.
+
+With the sync workers from gunicorn.sh, or the development server, a process
+handles one request at a time and requests queue up in the listen backlog
+instead. A proxy in front can stamp each request with an X-Request-Start header,
+eg in nginx: proxy_set_header X-Request-Start "t=${msec}";
+Time spent before reaching the worker then counts against the queue budget, so
+requests that already waited too long are shed before they are handled.
+"""
+
+import math
+import threading
+import time
+
+import uweb3
+
+def QueueTime(env):
+  """Returns the seconds since the proxy stamped the request with X-Request-Start.
+
+  Accepts the value in seconds, milliseconds or microseconds since the epoch,
+  optionally prefixed with 't=' as nginx and Apache do. Requests without, or
+  with an unreadable or non-finite header count as not queued."""
+  start = env.get('HTTP_X_REQUEST_START', '').strip()
+  if start.startswith('t='):
+    start = start[2:]
+  try:
+    start = float(start)
+  except ValueError:
+    return 0
+  if not math.isfinite(start):
+    return 0
+  if start > 1e14:
+    start /= 1e6
+  elif start > 1e11:
+    start /= 1e3
+  return max(time.time() - start, 0)
+
+
+class Limit:
+  """Concurrency limit and admission counters for a single route handler."""
+
+  def __init__(self, concurrency, queue_time=0):
+    """Sets up the limit.
+
+    Arguments:
+      @ concurrency: int
+        Number of requests that may be handled at the same time.
+      % queue_time: float ~~ 0
+        Seconds a request may wait for a slot before it is shed.
+    """
+    self.concurrency = concurrency
+    self.queue_time = queue_time
+    self.admitted = 0
+    self.shed = 0
+    self._slots = threading.BoundedSemaphore(concurrency)
+    self._lock = threading.Lock()
+
+  def Acquire(self, queued=0):
+    """Returns True if the request was given a slot within the queue time.
+
+    Arguments:
+      % queued: float ~~ 0
+        Seconds the request already spent queued before reaching us.
+    """
+    budget = self.queue_time - queued
+    admitted = budget >= 0 and self._slots.acquire(timeout=budget)
+    with self._lock:
+      if admitted:
+        self.admitted += 1
+      else:
+        self.shed += 1
+    return admitted
+
+  def Release(self):
+    """Frees the slot taken by an admitted request."""
+    self._slots.release()
+
+  def Stats(self):
+    """Returns the limit and counters as a dict."""
+    return {'concurrency': self.concurrency,
+            'queue_time': self.queue_time,
+            'admitted': self.admitted,
+            'shed': self.shed}
+
+
+class AdmissionControl:
+  """Holds the configured limits and builds the responses for shed requests."""
+
+  def __init__(self, options):
+    """Reads the limits from the [admission] config section.
+
+    Arguments:
+      @ options: dict
+        The [admission] section, mapping a lowercased handler name to its
+        'concurrency[, queue_time]'. `retry_after` sets the Retry-After header.
+    """
+    options = dict(options)
+    self.retry_after = int(options.pop('retry_after', 1))
+    self.limits = {}
+    for handler, value in options.items():
+      concurrency, _sep, queue_time = value.partition(',')
+      self.limits[handler] = Limit(int(concurrency), float(queue_time or 0))
+
+  def Limit(self, handler):
+    """Returns the Limit for the given route handler name, or None."""
+    if handler is None:
+      return None
+    return self.limits.get(handler.lower())
+
+  def Shed(self):
+    """Returns the 503 response for a request that could not be admitted."""
+    return uweb3.Response('Service temporarily overloaded, please retry.',
+                          content_type='text/plain',
+                          httpcode=503,
+                          headers={'Retry-After': str(self.retry_after)})
+
+  def Stats(self):
+    """Returns the counters for all limited routes."""
+    return {handler: limit.Stats() for handler, limit in self.limits.items()}
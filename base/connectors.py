@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+"""Tuned connectors for the uweb3 test server.
+
+The stock Sqlite connector opens the database with the default rollback
+journal, which makes readers and writers from different workers block each
+other. These connectors read a few extra options from the [sqlite] section of
+config.ini to enable WAL, memory mapped IO, a larger prepared statement cache
+and a separate read-only connection for the read routes.
+"""
+
+import configparser
+import urllib.parse
+
+from uweb3 import connectors
+from uweb3.libs.sqltalk import sqlite
+
+class Sqlite(connectors.Sqlite):
+  """SQLite connector that applies the performance options from the config.
+
+  Understood options in the [sqlite] section, all optional:
+    journal_mode: str, eg WAL. Persisted in the database file by SQLite.
+    synchronous: str, eg NORMAL, which is safe for WAL mode.
+    mmap_size: int, bytes of the database file to memory map.
+    cached_statements: int, size of the per connection prepared statement cache.
+    busy_timeout: int, milliseconds to wait on a locked database.
+  """
+  READ_ONLY = False
+
+  def __init__(self, config, options, request, debug=False):
+    """Returns a SQLite database connection with the configured pragmas."""
+    self.debug = debug
+    self.options = options.get('sqlite', {})
+    try:
+      self.connection = self._Connect()
+    except Exception as e:
+      raise ConnectionError('Connection to "%s" of type "%s" resulted in: %r' % (self.Name(), type(self), e))
+
+  def _Connect(self):
+    """Opens the database connection and applies the connection pragmas."""
+    kwds = {}
+    if self.options.get('cached_statements'):
+      kwds['cached_statements'] = int(self.options['cached_statements'])
+    connection = sqlite.Connect(self.options.get('database'), **kwds)
+    if not self._JournalModeSet(connection):
+      connection.execute('PRAGMA journal_mode = %s' % self._Pragma('journal_mode'))
+    self._ApplyPragmas(connection)
+    return connection
+
+  def _JournalModeSet(self, connection):
+    """Returns True if the database already uses the configured journal mode."""
+    if not self.options.get('journal_mode'):
+      return True
+    mode = connection.execute('PRAGMA journal_mode').fetchone()[0]
+    return mode.upper() == self._Pragma('journal_mode')
+
+  def _ApplyPragmas(self, connection):
+    """Applies the per connection pragmas, these are not stored in the file."""
+    if self.options.get('busy_timeout'):
+      connection.execute('PRAGMA busy_timeout = %d' % int(self.options['busy_timeout']))
+    if self.options.get('mmap_size'):
+      connection.execute('PRAGMA mmap_size = %d' % int(self.options['mmap_size']))
+    if self.options.get('synchronous') and not self.READ_ONLY:
+      connection.execute('PRAGMA synchronous = %s' % self._Pragma('synchronous'))
+
+  def _Pragma(self, name):
+    """Returns a keyword pragma value from the config, refusing anything else."""
+    value = self.options[name].strip()
+    if not value.isalpha():
+      raise ValueError('Invalid value for sqlite option %s: %r' % (name, value))
+    return value.upper()
+
+  def _Flag(self, name, default):
+    """Returns a boolean option from the config, parsed like configparser does."""
+    value = self.options.get(name, default).strip().lower()
+    if value not in configparser.ConfigParser.BOOLEAN_STATES:
+      raise ValueError('Invalid value for sqlite option %s: %r' % (name, value))
+    return configparser.ConfigParser.BOOLEAN_STATES[value]
+
+
+class SqliteReader(Sqlite):
+  """SQLite connector for read routes, using its own connection.
+
+  With `read_only = True` in the [sqlite] section the connection is opened with
+  mode=ro, so it can never take the write lock. In WAL mode these readers do
+  not block, nor get blocked by, a writer in another worker.
+
+  Only the read routes use this connector, through the ReadOnlyFish model. The
+  Fish model keeps writing through the regular Sqlite connector.
+  """
+  READ_ONLY = True
+
+  def _Connect(self):
+    """Opens a read-only connection, or a regular one if so configured."""
+    if not self._Flag('read_only', 'True'):
+      return super(SqliteReader, self)._Connect()
+    connection = self._ConnectReadOnly()
+    if not self._JournalModeSet(connection):
+      # A read-only connection cannot switch the journal mode, which is stored
+      # in the database file. This converts the file once through a writer.
+      connection.close()
+      writer = sqlite.Connect(self.options.get('database'))
+      writer.execute('PRAGMA journal_mode = %s' % self._Pragma('journal_mode'))
+      writer.close()
+      connection = self._ConnectReadOnly()
+    self._ApplyPragmas(connection)
+    return connection
+
+  def _ConnectReadOnly(self):
+    """Opens the database with mode=ro."""
+    kwds = {'uri': True}
+    if self.options.get('cached_statements'):
+      kwds['cached_statements'] = int(self.options['cached_statements'])
+    return sqlite.Connect('file:%s?mode=ro' % urllib.parse.quote(self.options.get('database')), **kwds)
@@ -9,6 +9,11 @@ class Fish(model.Record):
   """Model for the Sqlite example"""
   _CONNECTOR = 'sqlite'
 
+class ReadOnlyFish(Fish):
+  """Model for the Sqlite read routes, read through the read-only connection"""
+  _CONNECTOR = 'sqliteReader'
+  _TABLE = 'fish'
+
 class Tank(model.Record):
   """Model for the Mysql example"""
 
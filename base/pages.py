@@ -7,13 +7,18 @@ import json
 import uweb3
 
 # package imports
+from . import connectors
 from . import model
+from . import request
 
-class PageMaker(uweb3.DebuggingPageMaker, uweb3.SparseAsyncPages):
+class PageMaker(request.LazyVarsMixin, uweb3.DebuggingPageMaker, uweb3.SparseAsyncPages):
   """Holds all the request handlers for the application"""
 
   def _PostInit(self):
-    """Register some vars to be used in the template parser later on"""
+    """Register some vars to be used in the template parser later on, and our
+    tuned sqlite connectors before any model asks for them"""
+    self.connection.RegisterConnector(connectors.Sqlite)
+    self.connection.RegisterConnector(connectors.SqliteReader)
     self.parser.RegisterTag('header:part', "path test")
     self.parser.RegisterTag('header:1:test:2', "sparse path test")
     self.parser.RegisterTag('footer', "<b>escaped html test</b>")
@@ -113,7 +118,7 @@ class PageMaker(uweb3.DebuggingPageMaker, uweb3.SparseAsyncPages):
   def SqliteRead(self, fish=1):
     """Reads form the SQLite db"""
     try:
-      return model.Fish.FromPrimary(self.connection, int(fish))
+      return model.ReadOnlyFish.FromPrimary(self.connection, int(fish))
     except uweb3.model.NotExistError:
       return uweb3.Response('No such fish',
                             httpcode=404,
@@ -146,6 +151,11 @@ class PageMaker(uweb3.DebuggingPageMaker, uweb3.SparseAsyncPages):
                             httpcode=404,
                             content_type='text/plain')
 
+  def AdmissionStats(self):
+    """Returns the admitted and shed counters for the limited routes"""
+    return uweb3.Response(self.req.registry.admission.Stats(),
+                          content_type='application/json')
+
   def ThrowError(self):
     """The request could not be fulfilled, this returns a 500."""
     return test
@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+"""Lazy request wrapper for the uweb3 test server.
+
+The stock uweb3 Request decodes the cookies, query arguments, headers and body
+before routing, even for handlers like Static that use none of them. This
+Request parses each of them on first use, and caches the result.
+
+Parts of this module, and the request handler in the base package, are copies of
+uweb3 code from the release in UWEB3_VERSION. On any other uweb3 release the
+application falls back to the stock uweb3 request handling instead.
+"""
+
+import functools
+import io
+import json
+from urllib.parse import parse_qs
+
+from uweb3 import pagemaker
+from uweb3 import request
+from uweb3.connections import ConnectionManager
+
+# The uweb3 release the copied uweb3 code in this package was taken from.
+UWEB3_VERSION = '3.0.4'
+
+class RequestVars(dict):
+  """The `vars` dictionary of a Request, each key is parsed on first access.
+
+  Keys are 'cookie', 'get', and for POST, PUT and DELETE requests the
+  lowercased method name holding the parsed body. Iterating, or converting to a
+  plain dict, yields all of these like the eager uweb3 vars, parsing them all.
+  """
+
+  def __init__(self, req):
+    """Sets up the empty vars for the given Request."""
+    super(RequestVars, self).__init__()
+    self.req = req
+
+  def _Parsers(self):
+    """Returns a dict of parser methods for the vars this request can have."""
+    parsers = {'cookie': self.req.ParseCookies,
+               'get': self.req.ParseQuery}
+    if self.req.method in ('POST', 'PUT', 'DELETE'):
+      parsers[self.req.method.lower()] = self.req.ParseBody
+    return parsers
+
+  def __missing__(self, key):
+    """Parses and stores the requested var."""
+    value = self[key] = self._Parsers()[key]()
+    return value
+
+  def __contains__(self, key):
+    """Returns True if the var exists, without parsing it."""
+    return dict.__contains__(self, key) or key in self._Parsers()
+
+  def __iter__(self):
+    """Yields the parsed var names, then those not yet parsed."""
+    yield from dict.keys(self)
+    for key in self._Parsers():
+      if not dict.__contains__(self, key):
+        yield key
+
+  def __len__(self):
+    """Returns the number of vars, without parsing them."""
+    return len(list(iter(self)))
+
+  def keys(self):
+    """Returns all var names, parsed or not."""
+    return list(self)
+
+  def values(self):
+    """Returns all vars, parsing those that were not yet."""
+    return [self[key] for key in self]
+
+  def items(self):
+    """Returns all var names and vars, parsing those that were not yet."""
+    return [(key, self[key]) for key in self]
+
+  def get(self, key, default=None):
+    """Returns the parsed var for `key`, or the `default` if it doesn't exist."""
+    try:
+      return self[key]
+    except KeyError:
+      return default
+
+
+class Request(request.Request):
+  """Request that parses its cookies, query arguments, headers and body only
+  when they are first used."""
+
+  def __init__(self, env, registry):
+    """Wraps the WSGI environment, leaving all parsing for later."""
+    self.env = env
+    self.registry = registry
+    self._out_headers = []
+    self._out_status = 200
+    self._response = None
+    self.method = self.env['REQUEST_METHOD']
+    self.vars = RequestVars(self)
+    self.env['host'] = self.env.get('HTTP_HOST', '')
+
+  @functools.cached_property
+  def headers(self):
+    """Returns the request headers from the environment."""
+    return dict(self.headers_from_env(self.env))
+
+  @functools.cached_property
+  def input(self):
+    """Returns the raw request body."""
+    request_body_size = 0
+    try:
+      request_body_size = int(self.env.get('CONTENT_LENGTH', 0))
+    except Exception:
+      pass
+    return self.env['wsgi.input'].read(request_body_size)
+
+  def ParseCookies(self):
+    """Returns the cookies as a dict of name and value."""
+    return {name: value.value
+            for name, value in request.Cookie(self.env.get('HTTP_COOKIE')).items()}
+
+  def ParseQuery(self):
+    """Returns the query arguments."""
+    return request.QueryArgsDict(parse_qs(self.env.get('QUERY_STRING', '')))
+
+  def ParseBody(self):
+    """Returns the request body, parsed as json or form data."""
+    if self.env.get('CONTENT_TYPE', '') == 'application/json':
+      return json.loads(self.input)
+    return request.IndexedFieldStorage(io.StringIO(self.input.decode('utf-8')),
+                                       environ={'REQUEST_METHOD': 'POST'})
+
+
+class LazyVarsMixin:
+  """PageMaker mixin that reads cookies and request data from the request when
+  they are used, instead of copying them over on init.
+
+  Signed cookies are read through the same vars, so their decoding waits until
+  a SecureCookie model is instantiated.
+  """
+
+  def __init__(self, req, config=None, executing_path=None):
+    """Sets up the PageMaker like BasePageMaker.__init__ from uweb3 3.0.4 does,
+    minus the request vars. Keep in sync with UWEB3_VERSION.
+
+    For a stock uweb3 Request, as used on other uweb3 releases, this runs the
+    stock BasePageMaker.__init__ instead."""
+    if not isinstance(req, Request):
+      super(LazyVarsMixin, self).__init__(req, config=config, executing_path=executing_path)
+      return
+    super(pagemaker.BasePageMaker, self).__init__()
+    self._BasePageMaker__SetupPaths(executing_path)
+    self.req = req
+    self.config = config or None
+    self.options = config.options if config else {}
+    self.debug = pagemaker.DebuggerMixin in self.__class__.__mro__
+    try:
+      self.connection = self.persistent.Get('connection')
+    except KeyError:
+      self.persistent.Set('connection', ConnectionManager(self.config, self.options, self.debug))
+      self.connection = self.persistent.Get('connection')
+
+  def _Var(self, name):
+    """Returns the named request var, or an empty dict if it has none."""
+    return self.req.vars[name] if name in self.req.vars else {}
+
+  @property
+  def cookies(self):
+    """Returns the request cookies."""
+    return self.req.vars['cookie']
+
+  @cookies.setter
+  def cookies(self, value):
+    """Replaces the request's 'cookie' var, not an attribute on the PageMaker."""
+    self.req.vars['cookie'] = value
+
+  @property
+  def get(self):
+    """Returns the query arguments."""
+    return self.req.vars['get']
+
+  @get.setter
+  def get(self, value):
+    """Replaces the request's 'get' var, not an attribute on the PageMaker."""
+    self.req.vars['get'] = value
+
+  @property
+  def post(self):
+    """Returns the POST body."""
+    return self._Var('post')
+
+  @post.setter
+  def post(self, value):
+    """Replaces the request's 'post' var, not an attribute on the PageMaker."""
+    self.req.vars['post'] = value
+
+  @property
+  def put(self):
+    """Returns the PUT body."""
+    return self._Var('put')
+
+  @put.setter
+  def put(self, value):
+    """Replaces the request's 'put' var, not an attribute on the PageMaker."""
+    self.req.vars['put'] = value
+
+  @property
+  def delete(self):
+    """Returns the DELETE body."""
+    return self._Var('delete')
+
+  @delete.setter
+  def delete(self, value):
+    """Replaces the request's 'delete' var, not an attribute on the PageMaker."""
+    self.req.vars['delete'] = value
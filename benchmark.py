@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Benchmarks for the uWeb3 test server.
+
+These run without a webserver, directly against the components under test.
+
+Compare the sqlite connector with and without the [sqlite] performance options
+from base/config.ini, using concurrent reader processes and a writer:
+  python3 benchmark.py sqlite --readers 4 --duration 5
+
+Compare the per request time of the lazy request wrapper against the eager
+uweb3 one, for routes that do not use cookies, query arguments or headers:
+  python3 benchmark.py request --requests 5000
+"""
+
+import argparse
+import configparser
+import contextlib
+import io
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import uweb3
+
+import base
+from base import connectors
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'base', 'config.ini')
+DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aquarium.sqlite')
+REQUEST_ENV = {
+    'REQUEST_METHOD': 'GET',
+    'QUERY_STRING': 'page=2&sort=name&filter=shark&filter=squid&utm_source=benchmark',
+    'REMOTE_ADDR': '127.0.0.1',
+    'SERVER_NAME': '127.0.0.1',
+    'SERVER_PORT': '8002',
+    'SERVER_PROTOCOL': 'HTTP/1.1',
+    'HTTP_HOST': '127.0.0.1:8002',
+    'HTTP_USER_AGENT': 'Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/118.0',
+    'HTTP_ACCEPT': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'HTTP_ACCEPT_LANGUAGE': 'nl,en-US;q=0.7,en;q=0.3',
+    'HTTP_ACCEPT_ENCODING': 'gzip, deflate, br',
+    'HTTP_CONNECTION': 'keep-alive',
+    'HTTP_COOKIE': ('example="this is an example cookie value set by uWeb"; '
+                    'xsrf=5f0c7a3e9b1d2c4e6f8a0b1c2d3e4f5a6b7c8d9e; '
+                    'signedExample=84d11423e847f8c96a555b5561290ffb1d3c37c7+'
+                    '80049538000000000000007d948c036b6579948c2b7468697320697320'
+                    '616e206578616d706c6520636f6f6b69652076616c756520736574; '
+                    'theme=dark; consent=1'),
+    'wsgi.url_scheme': 'http',
+}
+
+def SqliteReader(options, deadline, results):
+  """Reads the fish record until the deadline, like the SqliteRead route."""
+  connection = connectors.SqliteReader(None, {'sqlite': options}, None).connection
+  done = failed = 0
+  while time.time() < deadline:
+    try:
+      with connection as cursor:
+        cursor.Execute('SELECT * FROM `fish` WHERE `ID` = ?', (1,))
+      done += 1
+    except connectors.sqlite.OperationalError:
+      failed += 1
+  connection.close()
+  results.put(('read', done, failed))
+
+def SqliteWriter(options, deadline, results):
+  """Updates the fish record until the deadline, committing every write."""
+  connection = connectors.Sqlite(None, {'sqlite': options}, None).connection
+  done = failed = 0
+  while time.time() < deadline:
+    try:
+      connection.execute('UPDATE `fish` SET `name` = ? WHERE `ID` = ?', ('sammy %d' % done, 1))
+      connection.commit()
+      done += 1
+    except connectors.sqlite.OperationalError:
+      connection.rollback()
+      failed += 1
+  connection.close()
+  results.put(('write', done, failed))
+
+def SqliteRun(options, readers, duration):
+  """Runs one reader/writer round on a scratch copy of the database.
+
+  Returns a dict with the per second counts for 'read' and 'write', and the
+  total number of 'failed' operations due to lock contention."""
+  scratch = tempfile.mkdtemp()
+  try:
+    options = dict(options, database=os.path.join(scratch, 'aquarium.sqlite'))
+    shutil.copy(DATABASE, options['database'])
+    # Prepare the file once, so the workers do not race to set the journal mode
+    connectors.Sqlite(None, {'sqlite': options}, None).connection.close()
+    results = multiprocessing.Queue()
+    deadline = time.time() + duration
+    workers = [multiprocessing.Process(target=SqliteWriter, args=(options, deadline, results))]
+    workers.extend(multiprocessing.Process(target=SqliteReader, args=(options, deadline, results))
+                   for _reader in range(readers))
+    for worker in workers:
+      worker.start()
+    totals = {'read': 0, 'write': 0, 'failed': 0}
+    for _worker in workers:
+      kind, done, failed = results.get()
+      totals[kind] += done
+      totals['failed'] += failed
+    for worker in workers:
+      worker.join()
+  finally:
+    shutil.rmtree(scratch)
+  totals['read'] /= duration
+  totals['write'] /= duration
+  return totals
+
+def Sqlite(args):
+  """Compares the stock sqlite setup against the configured performance mode."""
+  config = configparser.ConfigParser()
+  config.read(CONFIG)
+  modes = (('default', {'journal_mode': 'DELETE', 'read_only': 'False'}),
+           ('configured', dict(config['sqlite'])))
+  print('%d readers, 1 writer, %d seconds per mode' % (args.readers, args.duration))
+  print('%-12s %12s %12s %8s' % ('mode', 'reads/s', 'writes/s', 'failed'))
+  for name, options in modes:
+    totals = SqliteRun(options, args.readers, args.duration)
+    print('%-12s %12.0f %12.0f %8d' % (name, totals['read'], totals['write'], totals['failed']))
+
+def StartResponse(status, headers):
+  """Discards the response status and headers."""
+
+def RequestTime(app, path, requests):
+  """Returns the average seconds the app spends handling a GET for `path`."""
+  start = time.perf_counter()
+  for _request in range(requests):
+    env = dict(REQUEST_ENV, PATH_INFO=path)
+    env['wsgi.input'] = io.BytesIO()
+    b''.join(app(env, StartResponse))
+  return (time.perf_counter() - start) / requests
+
+def Request(args):
+  """Compares the eager uweb3 Request against the lazy one, per route."""
+  app = base.main()
+  if app.stock_handling:
+    sys.exit('The lazy request needs uweb3 %s, there is nothing to compare.'
+             % base.request.UWEB3_VERSION)
+  print('%d requests per route and wrapper' % args.requests)
+  print('%-20s %12s %12s %8s' % ('path', 'eager us', 'lazy us', 'saved'))
+  # Handlers may print debugging output, which would swamp the timings.
+  with contextlib.redirect_stdout(io.StringIO()) as output:
+    timings = []
+    for path in args.paths:
+      app.REQUEST_CLASS = uweb3.request.Request
+      RequestTime(app, path, args.requests // 10)
+      eager = RequestTime(app, path, args.requests)
+      del app.REQUEST_CLASS
+      RequestTime(app, path, args.requests // 10)
+      lazy = RequestTime(app, path, args.requests)
+      timings.append((path, eager, lazy))
+  for path, eager, lazy in timings:
+    print('%-20s %12.1f %12.1f %7.0f%%' % (
+        path, eager * 1e6, lazy * 1e6, (eager - lazy) / eager * 100))
+
+def main():
+  """Parses the commandline and runs the requested benchmark."""
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  benchmarks = parser.add_subparsers(dest='benchmark', required=True)
+  sqlite = benchmarks.add_parser('sqlite', help='concurrent sqlite reads and writes')
+  sqlite.add_argument('--readers', type=int, default=4, help='reader processes')
+  sqlite.add_argument('--duration', type=float, default=5, help='seconds per mode')
+  sqlite.set_defaults(run=Sqlite)
+  request = benchmarks.add_parser('request', help='eager against lazy request parsing')
+  request.add_argument('--requests', type=int, default=5000, help='requests per route')
+  request.add_argument('paths', nargs='*', default=['/static/text.txt', '/json', '/nonexistant'],
+                       help='routes to request')
+  request.set_defaults(run=Request)
+  args = parser.parse_args()
+  args.run(args)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""This script soak tests the application from this same directory in-process.
+Where testrunner.py checks the output of each route, this keeps a mix of routes
+busy for a while and tracks the memory of the process while doing so.
+
+After a warmup the RSS and a tracemalloc snapshot are taken every interval. The
+test fails when the memory retained per request since the warmup exceeds the
+threshold, or when any route raised or answered with a server error, and
+reports the allocation sites that grew the most.
+
+You can start a 5 minute soak test by issuing: python3 soaktest.py --duration 300
+The sqlite route also loads its tank from MySQL, add it with: --sqlite
+"""
+
+import argparse
+import collections
+import contextlib
+import gc
+import io
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+import base
+
+ROUTES = (
+    ('template', '/', {}),
+    ('template globals', '/templateglobals', {}),
+    ('smart client json', '/templateglobals', {'HTTP_ACCEPT': 'application/json'}),
+    ('404', '/nonexistant', {}),
+)
+SQLITE_ROUTES = (
+    ('sqlite read', '/sqlite/read/1', {}),
+)
+IGNORED = (tracemalloc.Filter(False, tracemalloc.__file__),
+           tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+           tracemalloc.Filter(False, '<unknown>'))
+
+def Rss():
+  """Returns the resident set size of this process in bytes.
+
+  Falls back to the peak RSS where /proc is not available."""
+  try:
+    with open('/proc/self/status') as status:
+      for line in status:
+        if line.startswith('VmRSS:'):
+          return int(line.split()[1]) * 1024
+  except OSError:
+    pass
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def Request(app, path, headers):
+  """Requests `path` from the app, returns the status and response headers.
+
+  Exceptions escaping the app are returned as the status, so every broken route
+  shows up in the report before the soak test fails."""
+  env = {'REQUEST_METHOD': 'GET',
+         'PATH_INFO': path,
+         'QUERY_STRING': '',
+         'REMOTE_ADDR': '127.0.0.1',
+         'SERVER_NAME': '127.0.0.1',
+         'SERVER_PORT': '8002',
+         'SERVER_PROTOCOL': 'HTTP/1.1',
+         'HTTP_HOST': '127.0.0.1:8002',
+         'wsgi.url_scheme': 'http',
+         'wsgi.input': io.BytesIO()}
+  env.update(headers)
+  response = {}
+  def StartResponse(status, response_headers):
+    """Keeps the status and headers of the response."""
+    response['status'] = status
+    response['headers'] = response_headers
+  try:
+    b''.join(app(env, StartResponse))
+  except Exception as error:
+    return 'exception %s' % type(error).__name__, []
+  return response['status'], response['headers']
+
+def Round(app, routes, statuses):
+  """Requests each route once, and the signed cookie set and reflect pair.
+
+  Returns the number of requests made, and counts the statuses per route."""
+  for name, path, headers in routes:
+    status, _headers = Request(app, path, headers)
+    statuses[name, status] += 1
+  status, headers = Request(app, '/signedcookie/set', {})
+  statuses['signed cookie set', status] += 1
+  cookies = '; '.join(value.split(';')[0] for key, value in headers
+                      if key == 'Set-Cookie')
+  status, _headers = Request(app, '/signedcookie/reflect', {'HTTP_COOKIE': cookies})
+  statuses['signed cookie reflect', status] += 1
+  return len(routes) + 2
+
+def Snapshot():
+  """Returns a tracemalloc snapshot after a full garbage collection."""
+  gc.collect()
+  return tracemalloc.take_snapshot().filter_traces(IGNORED)
+
+def Soak(app, args, report):
+  """Runs the soak test, returns True if all routes answered without server
+  errors and the retained memory is acceptable."""
+  key_type = 'traceback' if args.frames > 1 else 'lineno'
+  routes = ROUTES + SQLITE_ROUTES if args.sqlite else ROUTES
+  statuses = collections.Counter()
+  requests = 0
+  start = time.time()
+  while time.time() < start + args.warmup:
+    requests += Round(app, routes, statuses)
+  baseline = previous = Snapshot()
+  baseline_requests = requests
+  baseline_traced = tracemalloc.get_traced_memory()[0]
+  baseline_rss = Rss()
+  print('warmup done after %d requests, rss %.1f MiB, traced %.1f MiB' % (
+      requests, baseline_rss / 2**20, baseline_traced / 2**20), file=report)
+  print('%8s %10s %10s %10s %12s  %s' % (
+      'seconds', 'requests', 'rss MiB', 'traced MiB', 'bytes/req', 'top growth'),
+      file=report)
+  snapshot = baseline
+  traced = baseline_traced
+  deadline = start + args.duration
+  while time.time() < deadline:
+    interval_end = min(time.time() + args.interval, deadline)
+    while time.time() < interval_end:
+      requests += Round(app, routes, statuses)
+    snapshot = Snapshot()
+    traced = tracemalloc.get_traced_memory()[0]
+    growth = snapshot.compare_to(previous, key_type)
+    top = str(growth[0].traceback[0]) if growth and growth[0].size_diff > 0 else '-'
+    print('%8.0f %10d %10.1f %10.1f %12.1f  %s' % (
+        time.time() - start, requests, Rss() / 2**20, traced / 2**20,
+        (traced - baseline_traced) / max(requests - baseline_requests, 1), top),
+        file=report)
+    previous = snapshot
+
+  retained = (traced - baseline_traced) / max(requests - baseline_requests, 1)
+  print('\nstatus per route:', file=report)
+  for (name, status), count in sorted(statuses.items()):
+    print('  %-24s %-28s %d' % (name, status, count), file=report)
+  print('\nrss grew %.1f MiB over %d requests after warmup' % (
+      (Rss() - baseline_rss) / 2**20, requests - baseline_requests), file=report)
+  print('top %d growing allocation sites since warmup:' % args.top, file=report)
+  growth = [stat for stat in snapshot.compare_to(baseline, key_type)
+            if stat.size_diff > 0]
+  for stat in growth[:args.top]:
+    print('  %s' % stat, file=report)
+    if args.frames > 1:
+      for line in stat.traceback.format():
+        print('    %s' % line, file=report)
+  errors = sorted((name, status, count) for (name, status), count in statuses.items()
+                  if status.startswith(('exception', '5')))
+  if errors:
+    print('\nFAIL: routes raised or answered with a server error:', file=report)
+    for name, status, count in errors:
+      print('  %-24s %-28s %d' % (name, status, count), file=report)
+    return False
+  if retained > args.threshold:
+    print('\nFAIL: %.1f bytes retained per request, threshold is %d' % (
+        retained, args.threshold), file=report)
+    return False
+  print('\nOK: %.1f bytes retained per request, threshold is %d' % (
+      retained, args.threshold), file=report)
+  return True
+
+def main():
+  """Parses the commandline, and exits non-zero if the soak test failed."""
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--duration', type=float, default=300,
+                      help='seconds to run, including the warmup')
+  parser.add_argument('--warmup', type=float, default=30,
+                      help='seconds to run before taking the baseline')
+  parser.add_argument('--interval', type=float, default=30,
+                      help='seconds between memory measurements')
+  parser.add_argument('--threshold', type=int, default=64,
+                      help='allowed bytes retained per request')
+  parser.add_argument('--top', type=int, default=10,
+                      help='number of growing allocation sites to report')
+  parser.add_argument('--frames', type=int, default=1,
+                      help='stack frames to keep per allocation site')
+  parser.add_argument('--sqlite', action='store_true',
+                      help='also soak the sqlite route, which needs the MySQL database')
+  args = parser.parse_args()
+  if args.duration <= args.warmup:
+    parser.error('--duration must be longer than --warmup')
+  tracemalloc.start(args.frames)
+  app = base.main()
+  report = sys.stdout
+  # Handlers print debugging output, which would swamp the report.
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    passed = Soak(app, args, report)
+  sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+  main()
@@ -7,10 +7,25 @@ You can start the webserver by issuing: python3 serve.py
 You can test test all the functions by issuing: python3 testrunner.py -v
 """
 
+import io
+import os
+import shutil
+import tempfile
+import time
 import unittest
+from unittest import mock
 import requests
 import hashlib
 
+import uweb3
+
+import base
+from base import admission
+from base import connectors
+from base import model
+from base import pages
+from base import request
+
 baseurl = 'http://127.0.0.1:8002/'
 def escape_html(string):
   """Quick and very dirty html escaping"""
@@ -20,6 +35,24 @@ def escape_html(string):
   string = string.replace('"', "&quot;")
   return string
 
+def WsgiRequest(app, path, method='GET', headers=None):
+  """Requests `path` from an in-process app, returns the status, headers and
+  body of the response."""
+  env = {'REQUEST_METHOD': method,
+         'PATH_INFO': path,
+         'QUERY_STRING': '',
+         'REMOTE_ADDR': '127.0.0.1',
+         'HTTP_HOST': '127.0.0.1:8002',
+         'wsgi.input': io.BytesIO()}
+  env.update(headers or {})
+  response = {}
+  def StartResponse(status, response_headers):
+    """Keeps the status and headers of the response."""
+    response['status'] = status
+    response['headers'] = dict(response_headers)
+  body = b''.join(app(env, StartResponse))
+  return response['status'], response['headers'], body
+
 def HashContent(string):
   """Helper function for hashing of template files, this is needed to allow
   users to download raw templates on their own which they know the hash for."""
@@ -344,7 +377,7 @@ class SQLitetests(unittest.TestCase):
     """Lets see if our complete record is served correctly"""
     url = baseurl + 'sqlite/read/1'
     r = requests.get(url)
-    returnvalue = escape_html("""Fish({'ID': 1, 'name': 'sammy', 'species': 'shark', 'tank': Tank({'ID': 1, 'name': 'Living Room'})})""")
+    returnvalue = escape_html("""ReadOnlyFish({'ID': 1, 'name': 'sammy', 'species': 'shark', 'tank': Tank({'ID': 1, 'name': 'Living Room'})})""")
     self.assertEqual(r.status_code, 200)
     self.assertEqual(r.text, returnvalue)
 
@@ -355,6 +388,35 @@ class SQLitetests(unittest.TestCase):
     self.assertEqual(r.status_code, 404)
 
 
+class SqliteConnectorTests(unittest.TestCase):
+  """Test the writer and read-only sqlite connectors on a scratch database"""
+
+  def setUp(self):
+    self.scratch = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.scratch)
+    database = os.path.join(self.scratch, 'aquarium.sqlite')
+    shutil.copy('aquarium.sqlite', database)
+    self.options = {'sqlite': {'database': database, 'read_only': 'True'}}
+
+  def test_write(self):
+    """Lets see if the Fish model still writes through the regular connector"""
+    self.assertEqual(model.Fish._CONNECTOR, connectors.Sqlite.Name())
+    connection = connectors.Sqlite(None, self.options, None).connection
+    self.addCleanup(connection.close)
+    connection.execute('UPDATE `fish` SET `name` = ? WHERE `ID` = ?', ('sammy the second', 1))
+    connection.commit()
+    self.assertEqual(model.Fish.FromPrimary(connection, 1)['name'], 'sammy the second')
+
+  def test_read_only(self):
+    """Lets see if the model for the read routes reads, but cannot write"""
+    self.assertEqual(model.ReadOnlyFish._CONNECTOR, connectors.SqliteReader.Name())
+    connection = connectors.SqliteReader(None, self.options, None).connection
+    self.addCleanup(connection.close)
+    self.assertEqual(model.ReadOnlyFish.FromPrimary(connection, 1)['name'], 'sammy')
+    with self.assertRaises(connectors.sqlite.OperationalError):
+      connection.execute('UPDATE `fish` SET `name` = ? WHERE `ID` = ?', ('sammy the second', 1))
+
+
 class Mysqltests(unittest.TestCase):
   def test_record(self):
     """Lets see if our complete record is served correctly"""
@@ -444,6 +506,164 @@ class PathTraversalTest(unittest.TestCase):
     self.assertEqual(r.status_code, 404)
     self.assertFalse(invalidresponse in r.text)
 
+class AdmissionTests(unittest.TestCase):
+  """Test the admission control counters"""
+
+  def test_counters(self):
+    """Lets see if a limited route counts its admitted requests"""
+    before = requests.get(baseurl + 'admission').json()['mysqlread']
+    requests.get(baseurl + 'mysql/read/1')
+    r = requests.get(baseurl + 'admission')
+    self.assertEqual(r.status_code, 200)
+    self.assertEqual(r.headers['Content-Type'], 'application/json; charset=utf-8')
+    after = r.json()['mysqlread']
+    self.assertEqual(after['admitted'], before['admitted'] + 1)
+    self.assertEqual(after['shed'], before['shed'])
+
+  def test_unlimited(self):
+    """Lets see if routes without a limit are left alone"""
+    r = requests.get(baseurl + 'admission')
+    self.assertNotIn('index', r.json())
+
+  def test_request_start(self):
+    """Lets see if a request that queued longer than its budget is shed"""
+    before = requests.get(baseurl + 'admission').json()['mysqlread']
+    stamp = 't=%.3f' % (time.time() - 10)
+    r = requests.get(baseurl + 'mysql/read/1', headers={'X-Request-Start': stamp})
+    self.assertEqual(r.status_code, 503)
+    self.assertEqual(r.headers['Retry-After'], '1')
+    after = requests.get(baseurl + 'admission').json()['mysqlread']
+    self.assertEqual(after['shed'], before['shed'] + 1)
+    self.assertEqual(after['admitted'], before['admitted'])
+
+  def test_request_start_invalid(self):
+    """Lets see if a non-finite request start counts as not queued"""
+    for stamp in ('nan', 't=inf', '-inf'):
+      before = requests.get(baseurl + 'admission').json()['mysqlread']
+      r = requests.get(baseurl + 'mysql/read/1', headers={'X-Request-Start': stamp})
+      self.assertNotEqual(r.status_code, 503)
+      after = requests.get(baseurl + 'admission').json()['mysqlread']
+      self.assertEqual(after['admitted'], before['admitted'] + 1)
+      self.assertEqual(after['shed'], before['shed'])
+
+
+class AdmissionSheddingTests(unittest.TestCase):
+  """Test load shedding on an in-process application"""
+
+  def setUp(self):
+    self.app = base.main()
+    self.limit = self.app.registry.admission.limits['index'] = admission.Limit(0, 0)
+
+  def test_shed(self):
+    """Lets see if a route without free slots is shed with a 503, without
+    creating a PageMaker or parsing a template"""
+    with mock.patch.object(pages.PageMaker, '__init__',
+                           side_effect=AssertionError) as pagemaker, \
+         mock.patch.object(uweb3.templateparser.Parser, 'Parse') as parse:
+      status, headers, _body = WsgiRequest(self.app, '/')
+    self.assertEqual(status, '503 Service Unavailable')
+    self.assertEqual(headers['Retry-After'], '1')
+    self.assertEqual(self.limit.shed, 1)
+    self.assertEqual(self.limit.admitted, 0)
+    pagemaker.assert_not_called()
+    parse.assert_not_called()
+
+  def test_shed_logged(self):
+    """Lets see if a shed request shows up in the access log"""
+    with mock.patch.object(self.app, '_logging') as logging:
+      WsgiRequest(self.app, '/')
+    logging.assert_called_once()
+    req, response = logging.call_args[0]
+    self.assertEqual(req.path, '/')
+    self.assertEqual(response.httpcode, 503)
+
+  def test_other_routes(self):
+    """Lets see if routes without a limit are still served"""
+    status, _headers, _body = WsgiRequest(self.app, '/json')
+    self.assertEqual(status, '200 OK')
+    self.assertEqual(self.limit.shed, 0)
+
+class LazyRequestTests(unittest.TestCase):
+  """Test that request vars are only parsed when used, in-process"""
+
+  def setUp(self):
+    self.app = base.main()
+    self.requests = []
+    tests = self
+    class RecordingRequest(request.Request):
+      """Lazy request that keeps itself around for inspection"""
+      def __init__(self, env, registry):
+        """Sets up the lazy request and records it on the test case."""
+        super(RecordingRequest, self).__init__(env, registry)
+        tests.requests.append(self)
+    self.app.REQUEST_CLASS = RecordingRequest
+    self.headers = {'HTTP_COOKIE': 'cookie="value"', 'QUERY_STRING': 'key=value'}
+
+  def parsed(self):
+    """Returns the names of the vars the last request parsed."""
+    return set(dict.keys(self.requests[-1].vars))
+
+  def test_unused(self):
+    """Lets see if routes that ignore the request vars leave them unparsed"""
+    for path in ('/json', '/static/text.txt'):
+      status, _headers, _body = WsgiRequest(self.app, path, headers=self.headers)
+      self.assertEqual(status, '200 OK')
+      self.assertEqual(self.parsed(), set())
+      self.assertNotIn('headers', vars(self.requests[-1]))
+
+  def test_cookies(self):
+    """Lets see if reading the cookies parses and caches only those"""
+    status, _headers, body = WsgiRequest(self.app, '/cookie/reflect', headers=self.headers)
+    self.assertEqual(status, '200 OK')
+    self.assertEqual(body, b'value')
+    self.assertEqual(self.parsed(), {'cookie'})
+
+  def test_no_body(self):
+    """Lets see if a GET request has no body vars"""
+    WsgiRequest(self.app, '/json')
+    self.assertFalse('post' in self.requests[-1].vars)
+    self.assertEqual(self.parsed(), set())
+
+  def test_dict(self):
+    """Lets see if a plain dict of the vars matches the eager uweb3 vars"""
+    WsgiRequest(self.app, '/method', 'POST', {'CONTENT_TYPE': 'application/json',
+                                              'CONTENT_LENGTH': '2',
+                                              'wsgi.input': io.BytesIO(b'{}')})
+    self.assertEqual(dict(self.requests[-1].vars), {'cookie': {}, 'get': {}, 'post': {}})
+
+  def test_assign(self):
+    """Lets see if the PageMaker request vars can be replaced, like the
+    checkxsrf decorator does"""
+    pagemaker = pages.PageMaker(request.Request({'REQUEST_METHOD': 'POST'}, None),
+                                config=self.app.config,
+                                executing_path=self.app.executing_path)
+    setattr(pagemaker, 'post', {})
+    self.assertEqual(pagemaker.post, {})
+    self.assertEqual(pagemaker.req.vars['post'], {})
+
+
+class StockHandlingTests(unittest.TestCase):
+  """Test the fallback to the stock uweb3 request handling on uweb3 releases
+  the lazy request was not copied from"""
+
+  def setUp(self):
+    with mock.patch.object(uweb3, '__version__', '0.0.0'), \
+         self.assertWarns(UserWarning):
+      self.app = base.main()
+
+  def test_stock(self):
+    """Lets see if the stock uweb3 request is used, and the PageMaker still
+    sees its cookies"""
+    self.assertIs(self.app.REQUEST_CLASS, uweb3.request.Request)
+    with mock.patch.object(uweb3.request, 'Request',
+                           wraps=uweb3.request.Request) as stock:
+      status, _headers, body = WsgiRequest(self.app, '/cookie/reflect',
+                                           headers={'HTTP_COOKIE': 'cookie="value"'})
+    self.assertEqual(status, '200 OK')
+    self.assertEqual(body, b'value')
+    stock.assert_called_once()
+
+
 class SmartClientTests(unittest.TestCase):
   """Test the 'smart' client functionality"""
 